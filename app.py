@@ -5,31 +5,766 @@ Useful for security camera analysis, document scanning, and visual threat detect
 """
 
 import os
-import base64
+import io
+import asyncio
 import json
-from openai import OpenAI
+import logging
+import hashlib
+import threading
+import time
+import importlib.util
+import httpx
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from openai import (
+    AsyncOpenAI,
+    DefaultAsyncHttpxClient,
+    APIConnectionError,
+    InternalServerError,
+    RateLimitError
+)
+from email.utils import parsedate_to_datetime
 from pathlib import Path
 
+try:
+    import pybase64 as b64
+except ImportError:  # optional: pip install pybase64 (SIMD base64 encoder)
+    import base64 as b64
+
+try:
+    import diskcache
+except ImportError:  # optional: pip install diskcache
+    diskcache = None
+
+try:
+    import orjson
+except ImportError:  # optional: pip install orjson
+    orjson = None
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # optional: pip install Pillow
+    Image = ImageOps = None
+
+try:
+    from tenacity import (
+        retry,
+        retry_if_exception,
+        stop_after_attempt,
+        wait_random_exponential
+    )
+except ImportError:  # optional: pip install tenacity
+    retry = None
+
+logger = logging.getLogger(__name__)
+
+# Vision-capable model; "gpt-4-turbo" or "gpt-4o-mini" also work
+MODEL = "gpt-4o"
+
+# Shared analysis instructions sent as the system message ahead of every
+# request; pass system_prompt= to replace them. At roughly 350 tokens this
+# text is below the 1024-token minimum for OpenAI's prompt cache, so it is
+# not cached on its own. Keeping it fixed and placing the images before
+# the per-call question lets repeated questions about the same images
+# share a system-plus-images prefix, which does reach that minimum once a
+# high-detail image is included.
+DEFAULT_SYSTEM_PROMPT = """You are an image analyst supporting a security operations team.
+You will be shown one or more images followed by a question from the analyst.
+
+General rules:
+- Describe only what is visible. Do not guess identities of people and do not
+  speculate beyond the evidence in the image.
+- Be specific about positions (left, right, foreground, background) so the
+  analyst can locate what you describe.
+- Transcribe any readable text exactly: overlays, timestamps, camera IDs,
+  signs, license plates, labels, screen contents, and document text.
+- Call out uncertainty explicitly, for example when an object is blurred,
+  partially hidden, or too small to identify.
+
+When an image looks like security camera footage, also report:
+- Camera identifier and date/time shown in any overlay.
+- People: count, clothing, visible equipment, and what each person is doing.
+- Vehicles: type, color, direction of travel, and readable plates.
+- Anything out of place, such as open doors or windows, unattended items,
+  damaged fences, or people in restricted areas.
+
+When an image looks like a screenshot (email, web page, application, or
+terminal), also report:
+- Sender, URLs, domains, and any mismatch between displayed and real links.
+- Signs of phishing or social engineering: urgency, threats, requests for
+  credentials or payment, spoofed branding, and spelling errors.
+- Error messages, warnings, or indicators of malware or unauthorized access.
+
+When several images are provided, refer to them by position (image 1,
+image 2, ...) and describe what changes between them.
+
+Answer the analyst's question first, then list any additional security
+relevant observations. Keep the answer concise and factual."""
+
+# Sources starting with one of these are sent to the API by URL; anything
+# else is treated as a local file path
+URL_PREFIXES = ('http://', 'https://')
+
+# MIME type by file extension for local images; unknown extensions are
+# sent as JPEG
+MIME_TYPES = {
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.png': 'image/png',
+    '.gif': 'image/gif',
+    '.webp': 'image/webp'
+}
+
+# "data:<mime>;base64," prefix per extension, precomputed as bytes
+DATA_URL_PREFIXES = {
+    ext: f"data:{mime_type};base64,".encode('ascii')
+    for ext, mime_type in MIME_TYPES.items()
+}
+JPEG_DATA_URL_PREFIX = DATA_URL_PREFIXES['.jpg']
+
+# Read size for streaming base64 encoding. Must be a multiple of 3 so that
+# no chunk except the last one produces "=" padding.
+CHUNK_SIZE = 255 * 1024
+
+# Local images smaller than this are sent as-is. Larger ones are
+# downscaled to what the API would keep anyway: "low" detail fits the
+# image into 512x512, otherwise into 2048x2048 with the shortest side
+# at most 768 pixels.
+DOWNSCALE_MIN_BYTES = 200_000
+LOW_DETAIL_MAX_SIDE = 512
+HIGH_DETAIL_MAX_SIDE = 2048
+HIGH_DETAIL_MAX_SHORT_SIDE = 768
+JPEG_QUALITY = 85
+EXIF_ORIENTATION = 0x0112
+
+# Images sent per request by analyze_multiple_images; larger lists are
+# split into several requests sent concurrently
+MAX_IMAGES_PER_REQUEST = 10
+
+# Default number of API calls analyze_batch keeps in flight at once
+DEFAULT_CONCURRENCY = 10
+
+# Keep-alive connections held open by the shared HTTP client
+MAX_KEEPALIVE_CONNECTIONS = 20
+
+# Transient API failures (429, 5xx, timeouts and dropped connections) are
+# retried with exponential backoff and random jitter when tenacity is
+# installed, waiting as long as the server's Retry-After header asks for
+# when it sends one. A 429 for an exhausted quota is not transient and is
+# raised at once. Without tenacity the SDK's own retries (2 by default)
+# are used.
+RETRYABLE_ERRORS = (RateLimitError, InternalServerError, APIConnectionError)
+RETRY_ATTEMPTS = 6
+RETRY_WAIT_MIN = 1  # seconds
+RETRY_WAIT_MAX = 20  # seconds
+RETRY_AFTER_MAX = 60  # seconds; longer Retry-After values fall back to backoff
+SDK_MAX_RETRIES = 0 if retry is not None else 2
+
+# A single AsyncOpenAI client is shared by every call. Its pooled
+# connections belong to the event loop that opened them, so the client
+# lives on one long-lived background loop: the sync wrappers run there
+# directly and coroutines on any other loop hand their requests to it.
+_client = None
+_background_loop = None
+_client_lock = threading.Lock()
+
+# Response cache for analyses of local files, selected with the
+# OPENAI_VISION_CACHE environment variable:
+#   "memory" (default) - reuse results within this process
+#   "disk"             - also persist them in CACHE_DIR (needs diskcache)
+#   "off"              - never cache
+# URL images are never cached: the image behind a URL (e.g. a camera
+# snapshot endpoint) can change at any time.
+CACHE_MODE = os.getenv("OPENAI_VISION_CACHE", "memory").lower()
+CACHE_DIR = Path("~/.cache/openai-vision").expanduser()
+CACHE_TTL = 7 * 24 * 60 * 60  # seconds
+CACHE_SIZE_LIMIT = 256 * 1024 * 1024  # bytes on disk
+MEMORY_CACHE_ENTRIES = 128
+
+_memory_cache = OrderedDict()
+_disk_cache = None
+_cache_lock = threading.Lock()
+
+
+def _iter_file_chunks(image_path, drop_cache):
+    """
+    Yield a local file in CHUNK_SIZE pieces using unbuffered reads
+    
+    Where supported, the kernel is told the file is read sequentially so
+    it can read ahead, and optionally to drop the pages afterwards so
+    one-shot reads of many frames do not crowd out the page cache.
+    
+    Args:
+        image_path (str): Path to the file
+        drop_cache (bool): Advise the kernel to evict the file's pages
+            once it has been read
+    
+    Yields:
+        bytes: CHUNK_SIZE bytes, except for the final chunk
+    """
+    fadvise = hasattr(os, 'posix_fadvise')
+    fd = os.open(image_path, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+    try:
+        if fadvise:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        
+        while chunk := os.read(fd, CHUNK_SIZE):
+            # os.read may return short; top the chunk up so that only the
+            # last one is smaller than CHUNK_SIZE
+            while len(chunk) < CHUNK_SIZE:
+                more = os.read(fd, CHUNK_SIZE - len(chunk))
+                if not more:
+                    break
+                chunk += more
+            yield chunk
+    finally:
+        if fadvise and drop_cache:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        os.close(fd)
+
+
+def _iter_base64_chunks(image_path):
+    """
+    Yield base64 encoded chunks of a local image file without reading
+    the whole file into memory at once
+    
+    Args:
+        image_path (str): Path to the image file
+    
+    Yields:
+        bytes: Base64 encoded chunk
+    """
+    for chunk in _iter_file_chunks(image_path, drop_cache=True):
+        yield b64.b64encode(chunk)
+
+
 def encode_image_to_base64(image_path):
     """
-    Encode a local image file to base64 string
+    Encode a local image file to base64
     
     Args:
         image_path (str): Path to the image file
     
     Returns:
-        str: Base64 encoded image string
+        bytes: Base64 encoded image (ASCII bytes)
     """
     try:
-        with open(image_path, "rb") as image_file:
-            return base64.b64encode(image_file.read()).decode('utf-8')
+        return b"".join(_iter_base64_chunks(image_path))
     except FileNotFoundError:
         raise FileNotFoundError(f"Image file not found: {image_path}")
     except Exception as e:
         raise Exception(f"Error encoding image: {str(e)}")
 
 
-def analyze_image_from_url(image_url, prompt="What's in this image?", detail="auto"):
+def write_data_url(image_path, out):
+    """
+    Write a local image file as a base64 data URL into a binary buffer
+    
+    The encoded chunks are written straight into the buffer as bytes, so
+    no intermediate full-size base64 string is built.
+    
+    Args:
+        image_path (str): Path to the image file
+        out (io.BytesIO): Buffer the data URL is written to
+    """
+    prefix = DATA_URL_PREFIXES.get(Path(image_path).suffix.lower(), JPEG_DATA_URL_PREFIX)
+    
+    try:
+        out.write(prefix)
+        for encoded in _iter_base64_chunks(image_path):
+            out.write(encoded)
+    except FileNotFoundError:
+        raise FileNotFoundError(f"Image file not found: {image_path}")
+    except Exception as e:
+        raise Exception(f"Error encoding image: {str(e)}")
+
+
+def image_file_to_data_url(image_path):
+    """
+    Build a base64 data URL for a local image file
+    
+    Args:
+        image_path (str): Path to the image file
+    
+    Returns:
+        str: Data URL suitable for the "image_url" content part
+    """
+    out = io.BytesIO()
+    write_data_url(image_path, out)
+    # The SDK only takes str; decode straight from the buffer in one pass
+    return str(out.getbuffer(), 'ascii')
+
+
+def _downscale_to_data_url(image_path, detail):
+    """
+    Downscale and re-encode a large local image as a data URL
+    
+    PNG files stay PNG so screenshot text is not blurred by lossy
+    compression; everything else is re-encoded as JPEG.
+    
+    Args:
+        image_path (str): Path to the image file
+        detail (str): "low", "high", or "auto"
+    
+    Returns:
+        str: Data URL, or None if the image does not need resizing or
+            Pillow is not installed
+    """
+    if Image is None or os.stat(image_path).st_size < DOWNSCALE_MIN_BYTES:
+        return None
+    
+    with Image.open(image_path) as original:
+        # Work out the target size from the header alone, so images that
+        # are already small enough are never decoded. EXIF orientations
+        # 5-8 rotate by 90 degrees and swap width and height.
+        width, height = original.size
+        if original.getexif().get(EXIF_ORIENTATION, 1) in (5, 6, 7, 8):
+            width, height = height, width
+        
+        if detail == "low":
+            scale = min(1.0, LOW_DETAIL_MAX_SIDE / max(width, height))
+        else:
+            scale = min(1.0,
+                        HIGH_DETAIL_MAX_SIDE / max(width, height),
+                        HIGH_DETAIL_MAX_SHORT_SIDE / min(width, height))
+        
+        if scale >= 1.0:
+            return None
+        
+        # Apply the EXIF Orientation tag; it is not kept in the re-encoded
+        # image, so rotated camera shots would otherwise upload sideways
+        img = ImageOps.exif_transpose(original)
+        img.thumbnail(
+            (max(1, round(width * scale)), max(1, round(height * scale))),
+            Image.LANCZOS
+        )
+        
+        buf = io.BytesIO()
+        if Path(image_path).suffix.lower() == '.png':
+            img.save(buf, format="PNG")
+            prefix = DATA_URL_PREFIXES['.png']
+        else:
+            if img.mode in ("RGBA", "LA", "PA") or "transparency" in img.info:
+                # JPEG has no alpha; flatten onto white instead of exposing
+                # whatever color is stored under transparent pixels
+                img = img.convert("RGBA")
+                background = Image.new("RGB", img.size, (255, 255, 255))
+                background.paste(img, mask=img.getchannel("A"))
+                img = background
+            elif img.mode not in ("RGB", "L"):
+                img = img.convert("RGB")
+            img.save(buf, format="JPEG", quality=JPEG_QUALITY)
+            prefix = JPEG_DATA_URL_PREFIX
+    
+    return (prefix + b64.b64encode(buf.getbuffer())).decode('ascii')
+
+
+def _get_client():
+    """
+    Return the shared AsyncOpenAI client, creating it on first use
+    
+    The client must only be used on the background loop; wrap its calls
+    in _on_background_loop.
+    
+    Returns:
+        AsyncOpenAI: Shared client with a pooled HTTP connection
+    """
+    global _client
+    
+    with _client_lock:
+        if _client is None:
+            # The key is only checked when the client is created, not per call
+            api_key = os.getenv("OPENAI_API_KEY")
+            if not api_key:
+                raise ValueError("OPENAI_API_KEY environment variable not set")
+            
+            http_client = DefaultAsyncHttpxClient(
+                # HTTP/2 multiplexes concurrent requests over one connection;
+                # it needs the optional "h2" package (pip install "httpx[http2]")
+                http2=importlib.util.find_spec("h2") is not None,
+                limits=httpx.Limits(max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS)
+            )
+            _client = AsyncOpenAI(
+                api_key=api_key,
+                http_client=http_client,
+                max_retries=SDK_MAX_RETRIES
+            )
+    
+    return _client
+
+
+def _get_background_loop():
+    """Return the background event loop, starting its thread on first use"""
+    global _background_loop
+    
+    with _client_lock:
+        if _background_loop is None:
+            _background_loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=_background_loop.run_forever,
+                name="openai-vision-loop",
+                daemon=True
+            ).start()
+    
+    return _background_loop
+
+
+def _run(coro):
+    """
+    Run a coroutine on the background event loop and wait for its result
+    
+    Args:
+        coro: Coroutine to run
+    
+    Returns:
+        The coroutine's result
+    """
+    return asyncio.run_coroutine_threadsafe(coro, _get_background_loop()).result()
+
+
+async def _on_background_loop(coro):
+    """
+    Await a coroutine on the background event loop from any running loop
+    
+    Args:
+        coro: Coroutine to run, typically a call on the shared client
+    
+    Returns:
+        The coroutine's result
+    """
+    loop = _get_background_loop()
+    if asyncio.get_running_loop() is loop:
+        return await coro
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, loop))
+
+
+async def _create_completion(client, **kwargs):
+    """
+    Call chat.completions.create, retrying transient failures when
+    tenacity is installed
+    
+    Args:
+        client (AsyncOpenAI): Client from _get_client
+        **kwargs: Arguments for chat.completions.create
+    
+    Returns:
+        ChatCompletion, or an AsyncStream when stream=True
+    """
+    return await _on_background_loop(client.chat.completions.create(**kwargs))
+
+
+def _is_transient(exc):
+    """
+    Tell whether a failed API call is worth retrying
+    
+    Args:
+        exc (Exception): Exception raised by chat.completions.create
+    
+    Returns:
+        bool: True for rate limits, server errors and connection failures,
+            False for everything else including an exhausted quota
+    """
+    if isinstance(exc, RateLimitError) and exc.code == "insufficient_quota":
+        return False
+    return isinstance(exc, RETRYABLE_ERRORS)
+
+
+def _retry_after(exc):
+    """
+    Read the delay requested by the server's Retry-After headers
+    
+    Args:
+        exc (Exception): Exception raised by chat.completions.create
+    
+    Returns:
+        float: Seconds to wait, or None if the response has no usable header
+    """
+    response = getattr(exc, "response", None)
+    if response is None:
+        return None
+    
+    headers = response.headers
+    try:
+        if "retry-after-ms" in headers:
+            seconds = float(headers["retry-after-ms"]) / 1000
+        elif "retry-after" in headers:
+            value = headers["retry-after"]
+            try:
+                seconds = float(value)
+            except ValueError:
+                seconds = parsedate_to_datetime(value).timestamp() - time.time()
+        else:
+            return None
+    except (TypeError, ValueError):
+        return None
+    
+    return seconds if 0 < seconds <= RETRY_AFTER_MAX else None
+
+
+if retry is not None:
+    _backoff = wait_random_exponential(min=RETRY_WAIT_MIN, max=RETRY_WAIT_MAX)
+    
+    def _retry_wait(retry_state):
+        """Wait as the server asks via Retry-After, else back off with jitter"""
+        delay = _retry_after(retry_state.outcome.exception())
+        return delay if delay is not None else _backoff(retry_state)
+    
+    _create_completion = retry(
+        wait=_retry_wait,
+        stop=stop_after_attempt(RETRY_ATTEMPTS),
+        retry=retry_if_exception(_is_transient),
+        reraise=True
+    )(_create_completion)
+
+
+def _encode_files(file_paths):
+    """
+    Build data URLs for several local image files in parallel
+    
+    Args:
+        file_paths (list): Paths to local image files
+    
+    Returns:
+        dict: Mapping of file path to data URL
+    """
+    if not file_paths:
+        return {}
+    
+    with ThreadPoolExecutor(max_workers=min(8, len(file_paths))) as executor:
+        return dict(zip(
+            file_paths,
+            executor.map(image_file_to_data_url, file_paths)
+        ))
+
+
+async def _image_cache_key(system_prompt, prompt, detail, image_sources):
+    """
+    Build a response cache key from the request parameters and the
+    contents of the local image files
+    
+    Requests that include a URL image are not cached, since the image
+    behind a URL can change while the URL stays the same.
+    
+    Args:
+        system_prompt (str): System message sent ahead of the images
+        prompt (str): Question or instruction about the images
+        detail (str): Detail level sent with the images
+        image_sources (list): Image URLs or file paths
+    
+    Returns:
+        str: Hex digest, or None if the request must not be cached
+    """
+    if CACHE_MODE == "off" or any(source.startswith(URL_PREFIXES)
+                                  for source in image_sources):
+        return None
+    
+    hasher = hashlib.sha256()
+    for part in (MODEL, system_prompt, prompt, detail):
+        hasher.update(part.encode('utf-8') + b"|")
+    
+    # Hash all files concurrently, like the encode pass
+    file_digests = await asyncio.gather(
+        *(asyncio.to_thread(_hash_file, source) for source in image_sources)
+    )
+    for file_digest in file_digests:
+        hasher.update(file_digest)
+    
+    return hasher.hexdigest()
+
+
+def _hash_file(image_path):
+    """SHA-256 digest of a local file, read chunk by chunk"""
+    hasher = hashlib.sha256()
+    try:
+        # Keep the pages cached: the file is read again for encoding on a miss
+        for chunk in _iter_file_chunks(image_path, drop_cache=False):
+            hasher.update(chunk)
+    except FileNotFoundError:
+        raise FileNotFoundError(f"Image file not found: {image_path}")
+    except Exception as e:
+        raise Exception(f"Error encoding image: {str(e)}")
+    return hasher.digest()
+
+
+def _get_disk_cache():
+    """Open the on-disk response cache, or return None if not enabled"""
+    global _disk_cache
+    
+    if CACHE_MODE != "disk" or diskcache is None:
+        return None
+    
+    with _cache_lock:
+        if _disk_cache is None:
+            _disk_cache = diskcache.Cache(
+                str(CACHE_DIR),
+                size_limit=CACHE_SIZE_LIMIT,
+                eviction_policy="least-recently-used"
+            )
+    return _disk_cache
+
+
+def _cache_get(key):
+    """
+    Look up a cached analysis result
+    
+    Args:
+        key (str): Cache key from _image_cache_key, may be None
+    
+    Returns:
+        dict: Copy of the cached result, or None on a miss
+    """
+    if key is None:
+        return None
+    
+    with _cache_lock:
+        result = _memory_cache.get(key)
+        if result is not None:
+            _memory_cache.move_to_end(key)
+    
+    if result is None:
+        disk_cache = _get_disk_cache()
+        if disk_cache is not None:
+            result = disk_cache.get(key)
+        if result is None:
+            return None
+        _cache_put_memory(key, result)
+    
+    return dict(result)
+
+
+def _cache_set(key, result):
+    """
+    Store a successful analysis result in the memory and disk caches
+    
+    Args:
+        key (str): Cache key from _image_cache_key, may be None
+        result (dict): Serializable result returned by an analyze function
+    """
+    if key is None or not result.get('success'):
+        return
+    
+    _cache_put_memory(key, dict(result))
+    disk_cache = _get_disk_cache()
+    if disk_cache is not None:
+        disk_cache.set(key, result, expire=CACHE_TTL)
+
+
+def _cache_put_memory(key, result):
+    """Insert into the in-memory LRU cache, evicting the oldest entry"""
+    with _cache_lock:
+        _memory_cache[key] = result
+        _memory_cache.move_to_end(key)
+        while len(_memory_cache) > MEMORY_CACHE_ENTRIES:
+            _memory_cache.popitem(last=False)
+
+
+def _response_to_dict(response):
+    """
+    Convert a chat completion response to a plain dict for display
+    
+    Args:
+        response: ChatCompletion returned by the API
+    
+    Returns:
+        dict: JSON-serializable view of the response
+    """
+    return {
+        'id': response.id,
+        'model': response.model,
+        'created': response.created,
+        'choices': [
+            {
+                'index': choice.index,
+                'message': {
+                    'role': choice.message.role,
+                    'content': choice.message.content
+                },
+                'finish_reason': choice.finish_reason
+            }
+            for choice in response.choices
+        ],
+        'usage': {
+            'prompt_tokens': response.usage.prompt_tokens,
+            'completion_tokens': response.usage.completion_tokens,
+            'total_tokens': response.usage.total_tokens
+        }
+    }
+
+
+def _single_image_messages(system_prompt, image_url, detail, prompt):
+    """
+    Build the messages for a single-image request
+    
+    The static system prompt comes first and the question last, so the
+    prefix stays identical across calls and can be served from OpenAI's
+    prompt cache.
+    
+    Args:
+        system_prompt (str): Stable instructions sent as the system message
+        image_url (str): Image URL or base64 data URL
+        detail (str): "low", "high", or "auto"
+        prompt (str): Question or instruction about the image
+    
+    Returns:
+        list: Messages for chat.completions.create
+    """
+    return [
+        {
+            "role": "system",
+            "content": system_prompt
+        },
+        {
+            "role": "user",
+            "content": [
+                {
+                    "type": "image_url",
+                    "image_url": {
+                        "url": image_url,
+                        "detail": detail
+                    }
+                },
+                {
+                    "type": "text",
+                    "text": prompt
+                }
+            ]
+        }
+    ]
+
+
+async def _local_image_url(image_path, detail):
+    """
+    Encode a local image as a data URL, shrinking oversized images first
+    to cut upload size and vision tokens
+    
+    Args:
+        image_path (str): Path to local image file
+        detail (str): "low", "high", or "auto"
+    
+    Returns:
+        str: Base64 data URL
+    """
+    data_url = await asyncio.to_thread(_downscale_to_data_url, image_path, detail)
+    if data_url is None:
+        data_url = await asyncio.to_thread(image_file_to_data_url, image_path)
+    return data_url
+
+
+def _dump_json(data):
+    """Serialize data as indented JSON, using orjson when installed"""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2).decode('utf-8')
+    return json.dumps(data, indent=2)
+
+
+def _cached_tokens(usage):
+    """Number of prompt tokens served from OpenAI's prompt cache"""
+    details = getattr(usage, 'prompt_tokens_details', None)
+    return (details.cached_tokens or 0) if details is not None else 0
+
+
+async def analyze_image_from_url_async(image_url, prompt="What's in this image?", detail="auto",
+                                       system_prompt=DEFAULT_SYSTEM_PROMPT):
     """
     Analyze an image from a URL using OpenAI Vision API
     
@@ -37,83 +772,49 @@ def analyze_image_from_url(image_url, prompt="What's in this image?", detail="au
         image_url (str): URL of the image to analyze
         prompt (str): Question or instruction about the image
         detail (str): "low", "high", or "auto" - affects token usage and analysis depth
+        system_prompt (str): Stable instructions sent as the system message
     
     Returns:
         dict: Response containing analysis and metadata
     """
-    api_key = os.getenv("OPENAI_API_KEY")
-    
-    if not api_key:
-        raise ValueError("OPENAI_API_KEY environment variable not set")
-    
-    client = OpenAI(api_key=api_key)
+    client = _get_client()
     
     try:
         print(f"Analyzing image from URL...")
         print(f"Prompt: '{prompt}'")
         print(f"Detail level: {detail}\n")
         
-        response = client.chat.completions.create(
-            model="gpt-4o",  # or "gpt-4-turbo" or "gpt-4o-mini" for different capabilities
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": prompt
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": image_url,
-                                "detail": detail
-                            }
-                        }
-                    ]
-                }
-            ],
+        cache_key = await _image_cache_key(system_prompt, prompt, detail, [image_url])
+        cached = _cache_get(cache_key)
+        if cached is not None:
+            print("✓ Using cached analysis\n")
+            return cached
+        
+        response = await _create_completion(
+            client,
+            model=MODEL,
+            messages=_single_image_messages(system_prompt, image_url, detail, prompt),
             max_tokens=1000
         )
         
-        # Display raw JSON response
-        print("=" * 60)
-        print("RAW API RESPONSE (JSON):")
-        print("=" * 60)
+        # Dump the raw JSON response only when debug logging is enabled,
+        # so the normal path skips building and serializing the dict
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("RAW API RESPONSE (JSON):\n%s",
+                         _dump_json(_response_to_dict(response)))
         
-        response_dict = {
-            'id': response.id,
-            'model': response.model,
-            'created': response.created,
-            'choices': [
-                {
-                    'index': choice.index,
-                    'message': {
-                        'role': choice.message.role,
-                        'content': choice.message.content
-                    },
-                    'finish_reason': choice.finish_reason
-                }
-                for choice in response.choices
-            ],
-            'usage': {
-                'prompt_tokens': response.usage.prompt_tokens,
-                'completion_tokens': response.usage.completion_tokens,
-                'total_tokens': response.usage.total_tokens
-            }
-        }
-        
-        print(json.dumps(response_dict, indent=2))
-        print("=" * 60 + "\n")
-        
-        return {
+        result = {
             'success': True,
             'analysis': response.choices[0].message.content,
             'model': response.model,
             'tokens_used': response.usage.total_tokens,
             'prompt_tokens': response.usage.prompt_tokens,
-            'completion_tokens': response.usage.completion_tokens
+            'completion_tokens': response.usage.completion_tokens,
+            'cached_tokens': _cached_tokens(response.usage)
         }
+        _cache_set(cache_key, result)
+        
+        return result
         
     except Exception as e:
         print(f"✗ Error analyzing image: {str(e)}")
@@ -123,7 +824,8 @@ def analyze_image_from_url(image_url, prompt="What's in this image?", detail="au
         }
 
 
-def analyze_image_from_file(image_path, prompt="What's in this image?", detail="auto"):
+async def analyze_image_from_file_async(image_path, prompt="What's in this image?", detail="auto",
+                                        system_prompt=DEFAULT_SYSTEM_PROMPT):
     """
     Analyze a local image file using OpenAI Vision API
     
@@ -131,97 +833,51 @@ def analyze_image_from_file(image_path, prompt="What's in this image?", detail="
         image_path (str): Path to local image file
         prompt (str): Question or instruction about the image
         detail (str): "low", "high", or "auto"
+        system_prompt (str): Stable instructions sent as the system message
     
     Returns:
         dict: Response containing analysis and metadata
     """
-    api_key = os.getenv("OPENAI_API_KEY")
-    
-    if not api_key:
-        raise ValueError("OPENAI_API_KEY environment variable not set")
-    
-    client = OpenAI(api_key=api_key)
+    client = _get_client()
     
     try:
         print(f"Analyzing local image: {image_path}")
         print(f"Prompt: '{prompt}'")
         print(f"Detail level: {detail}\n")
         
-        # Encode image to base64
-        base64_image = encode_image_to_base64(image_path)
-        
-        # Determine image type from file extension
-        file_ext = Path(image_path).suffix.lower()
-        mime_types = {
-            '.jpg': 'image/jpeg',
-            '.jpeg': 'image/jpeg',
-            '.png': 'image/png',
-            '.gif': 'image/gif',
-            '.webp': 'image/webp'
-        }
-        mime_type = mime_types.get(file_ext, 'image/jpeg')
+        cache_key = await _image_cache_key(system_prompt, prompt, detail, [image_path])
+        cached = _cache_get(cache_key)
+        if cached is not None:
+            print("✓ Using cached analysis\n")
+            return cached
         
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": prompt
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:{mime_type};base64,{base64_image}",
-                                "detail": detail
-                            }
-                        }
-                    ]
-                }
-            ],
+        data_url = await _local_image_url(image_path, detail)
+        
+        response = await _create_completion(
+            client,
+            model=MODEL,
+            messages=_single_image_messages(system_prompt, data_url, detail, prompt),
             max_tokens=1000
         )
         
-        # Display raw JSON response
-        print("=" * 60)
-        print("RAW API RESPONSE (JSON):")
-        print("=" * 60)
-        
-        response_dict = {
-            'id': response.id,
-            'model': response.model,
-            'created': response.created,
-            'choices': [
-                {
-                    'index': choice.index,
-                    'message': {
-                        'role': choice.message.role,
-                        'content': choice.message.content
-                    },
-                    'finish_reason': choice.finish_reason
-                }
-                for choice in response.choices
-            ],
-            'usage': {
-                'prompt_tokens': response.usage.prompt_tokens,
-                'completion_tokens': response.usage.completion_tokens,
-                'total_tokens': response.usage.total_tokens
-            }
-        }
-        
-        print(json.dumps(response_dict, indent=2))
-        print("=" * 60 + "\n")
+        # Dump the raw JSON response only when debug logging is enabled,
+        # so the normal path skips building and serializing the dict
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("RAW API RESPONSE (JSON):\n%s",
+                         _dump_json(_response_to_dict(response)))
         
-        return {
+        result = {
             'success': True,
             'analysis': response.choices[0].message.content,
             'model': response.model,
             'tokens_used': response.usage.total_tokens,
             'prompt_tokens': response.usage.prompt_tokens,
-            'completion_tokens': response.usage.completion_tokens
+            'completion_tokens': response.usage.completion_tokens,
+            'cached_tokens': _cached_tokens(response.usage)
         }
+        _cache_set(cache_key, result)
+        
+        return result
         
     except Exception as e:
         print(f"✗ Error analyzing image: {str(e)}")
@@ -231,76 +887,122 @@ def analyze_image_from_file(image_path, prompt="What's in this image?", detail="
         }
 
 
-def analyze_multiple_images(image_sources, prompt="Compare these images"):
+async def analyze_multiple_images_async(image_sources, prompt="Compare these images",
+                                        system_prompt=DEFAULT_SYSTEM_PROMPT):
     """
     Analyze multiple images in a single request
     
+    Duplicate sources are dropped. More than MAX_IMAGES_PER_REQUEST images
+    are split into several requests that run concurrently; each request
+    base64 encodes its own local files in parallel just before sending,
+    and the analyses are merged into one result.
+    
     Args:
         image_sources (list): List of image URLs or file paths
         prompt (str): Question or instruction about the images
+        system_prompt (str): Stable instructions sent as the system message
     
     Returns:
         dict: Response containing analysis
     """
-    api_key = os.getenv("OPENAI_API_KEY")
-    
-    if not api_key:
-        raise ValueError("OPENAI_API_KEY environment variable not set")
-    
-    client = OpenAI(api_key=api_key)
+    client = _get_client()
     
     try:
-        print(f"Analyzing {len(image_sources)} images...")
+        # Drop duplicates while keeping the original order
+        unique_sources = list(dict.fromkeys(image_sources))
+        if not unique_sources:
+            raise ValueError("No images to analyze")
+        
+        print(f"Analyzing {len(unique_sources)} images...")
         print(f"Prompt: '{prompt}'\n")
         
-        # Build content array with text prompt and images
-        content = [{"type": "text", "text": prompt}]
+        cache_key = await _image_cache_key(system_prompt, prompt, "auto", unique_sources)
+        cached = _cache_get(cache_key)
+        if cached is not None:
+            print("✓ Using cached analysis\n")
+            return cached
         
-        for source in image_sources:
-            if source.startswith('http://') or source.startswith('https://'):
-                # URL image
-                content.append({
-                    "type": "image_url",
-                    "image_url": {"url": source}
-                })
-            else:
-                # Local file
-                base64_image = encode_image_to_base64(source)
-                file_ext = Path(source).suffix.lower()
-                mime_types = {
-                    '.jpg': 'image/jpeg',
-                    '.jpeg': 'image/jpeg',
-                    '.png': 'image/png',
-                    '.gif': 'image/gif',
-                    '.webp': 'image/webp'
-                }
-                mime_type = mime_types.get(file_ext, 'image/jpeg')
+        sem = asyncio.Semaphore(DEFAULT_CONCURRENCY)
+        
+        chunks = [
+            unique_sources[i:i + MAX_IMAGES_PER_REQUEST]
+            for i in range(0, len(unique_sources), MAX_IMAGES_PER_REQUEST)
+        ]
+        
+        def chunk_range(index):
+            """1-based (first, last) image numbers covered by a chunk"""
+            first = index * MAX_IMAGES_PER_REQUEST + 1
+            return first, first + len(chunks[index]) - 1
+        
+        async def analyze_chunk(index):
+            text = prompt
+            if len(chunks) > 1:
+                # Each chunk is its own request; tell the model where its
+                # images sit in the full list so numbering stays global
+                first, last = chunk_range(index)
+                text = (f"These are images {first}-{last} of {len(unique_sources)}. "
+                        f"Number them starting from image {first}.\n\n{prompt}")
+            
+            async with sem:
+                # Encode this chunk's local files only once it may send, so
+                # at most DEFAULT_CONCURRENCY chunks of data URLs are held in
+                # memory; file reads and b64encode both release the GIL, so
+                # threads overlap the work
+                file_sources = [
+                    source for source in chunks[index]
+                    if not source.startswith(URL_PREFIXES)
+                ]
+                data_urls = await asyncio.to_thread(_encode_files, file_sources)
                 
-                content.append({
-                    "type": "image_url",
-                    "image_url": {
-                        "url": f"data:{mime_type};base64,{base64_image}"
+                # Images first and the text prompt last, so repeated calls
+                # with the same image set share a cacheable prefix
+                content = [
+                    {
+                        "type": "image_url",
+                        "image_url": {"url": data_urls.get(source, source)}
                     }
-                })
+                    for source in chunks[index]
+                ]
+                content.append({"type": "text", "text": text})
+                
+                return await _create_completion(
+                    client,
+                    model=MODEL,
+                    messages=[
+                        {
+                            "role": "system",
+                            "content": system_prompt
+                        },
+                        {
+                            "role": "user",
+                            "content": content
+                        }
+                    ],
+                    max_tokens=1500
+                )
         
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "user",
-                    "content": content
-                }
-            ],
-            max_tokens=1500
+        responses = await asyncio.gather(
+            *(analyze_chunk(index) for index in range(len(chunks)))
         )
         
+        analyses = [response.choices[0].message.content for response in responses]
+        if len(chunks) > 1:
+            analyses = [
+                "Images {}-{}:\n{}".format(*chunk_range(index), analysis)
+                for index, analysis in enumerate(analyses)
+            ]
+        
         print("✓ Analysis complete\n")
         
-        return {
+        result = {
             'success': True,
-            'analysis': response.choices[0].message.content,
-            'tokens_used': response.usage.total_tokens
+            'analysis': "\n\n".join(analyses),
+            'tokens_used': sum(response.usage.total_tokens for response in responses),
+            'cached_tokens': sum(_cached_tokens(response.usage) for response in responses)
         }
+        _cache_set(cache_key, result)
+        
+        return result
         
     except Exception as e:
         print(f"✗ Error analyzing images: {str(e)}")
@@ -310,27 +1012,229 @@ def analyze_multiple_images(image_sources, prompt="Compare these images"):
         }
 
 
-def main():
+async def analyze_image_async(source, prompt="What's in this image?", detail="auto",
+                              system_prompt=DEFAULT_SYSTEM_PROMPT):
     """
-    Main demonstration function with cybersecurity-relevant examples
+    Analyze an image given either a URL or a local file path
+    
+    http(s) URLs are always passed to the API by reference. Prefer this
+    for any image already reachable over HTTPS: it avoids downloading the
+    image and re-uploading it base64 encoded, which is about a third
+    larger than the raw file.
+    
+    Args:
+        source (str): Image URL or path to a local image file
+        prompt (str): Question or instruction about the image
+        detail (str): "low", "high", or "auto"
+        system_prompt (str): Stable instructions sent as the system message
+    
+    Returns:
+        dict: Response containing analysis and metadata
     """
-    print("=" * 60)
-    print("OpenAI Vision API Demo")
-    print("=" * 60 + "\n")
+    if source.startswith(URL_PREFIXES):
+        return await analyze_image_from_url_async(source, prompt, detail, system_prompt)
+    return await analyze_image_from_file_async(source, prompt, detail, system_prompt)
+
+
+async def _next_or_none(iterator):
+    """Return the next item of an async iterator, or None when exhausted"""
+    try:
+        return await iterator.__anext__()
+    except StopAsyncIteration:
+        return None
+
+
+async def _iter_stream(stream):
+    """
+    Iterate a response stream opened on the background loop from any loop
     
-    # Example 1: Analyze image from URL
-    print("EXAMPLE 1: Analyzing image from URL")
-    print("-" * 60)
+    The stream is closed when iteration ends or the caller stops early.
+    
+    Args:
+        stream (AsyncStream): Stream returned by _create_completion
+    
+    Yields:
+        ChatCompletionChunk: Chunks as they arrive
+    """
+    iterator = stream.__aiter__()
+    try:
+        while (chunk := await _on_background_loop(_next_or_none(iterator))) is not None:
+            yield chunk
+    finally:
+        await _on_background_loop(stream.close())
+
+
+async def analyze_image_stream_async(source, prompt="What's in this image?", detail="auto",
+                                     system_prompt=DEFAULT_SYSTEM_PROMPT, result=None):
+    """
+    Analyze an image URL or local file, yielding the analysis as it arrives
+    
+    Printing can start on the first token instead of waiting for the whole
+    completion to be generated and downloaded.
+    
+    Args:
+        source (str): Image URL or path to a local image file
+        prompt (str): Question or instruction about the image
+        detail (str): "low", "high", or "auto"
+        system_prompt (str): Stable instructions sent as the system message
+        result (dict): Optional dict filled with the same fields the other
+            analyze functions return once the stream has finished
+    
+    Yields:
+        str: Pieces of the analysis text
+    """
+    client = _get_client()
+    if result is None:
+        result = {}
+    
+    try:
+        cache_key = await _image_cache_key(system_prompt, prompt, detail, [source])
+        cached = _cache_get(cache_key)
+        if cached is not None:
+            result.update(cached)
+            yield cached['analysis']
+            return
+        
+        if source.startswith(URL_PREFIXES):
+            image_url = source
+        else:
+            image_url = await _local_image_url(source, detail)
+        
+        analysis = io.StringIO()
+        usage = None
+        model = None
+        
+        stream = await _create_completion(
+            client,
+            model=MODEL,
+            messages=_single_image_messages(system_prompt, image_url, detail, prompt),
+            max_tokens=1000,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        async for chunk in _iter_stream(stream):
+            model = chunk.model
+            if chunk.usage is not None:
+                # The final chunk carries usage and no choices
+                usage = chunk.usage
+            if chunk.choices and chunk.choices[0].delta.content:
+                text = chunk.choices[0].delta.content
+                analysis.write(text)
+                yield text
+        
+        result.update({
+            'success': True,
+            'analysis': analysis.getvalue(),
+            'model': model,
+            # Token counts are None if the stream ended without a usage chunk
+            'tokens_used': usage.total_tokens if usage else None,
+            'prompt_tokens': usage.prompt_tokens if usage else None,
+            'completion_tokens': usage.completion_tokens if usage else None,
+            'cached_tokens': _cached_tokens(usage) if usage else None
+        })
+        _cache_set(cache_key, result)
+        
+    except Exception as e:
+        print(f"✗ Error analyzing image: {str(e)}")
+        result.update({
+            'success': False,
+            'error': str(e)
+        })
+
+
+async def analyze_batch_async(sources, prompt="What's in this image?", detail="auto",
+                              concurrency=DEFAULT_CONCURRENCY,
+                              system_prompt=DEFAULT_SYSTEM_PROMPT):
+    """
+    Analyze many images concurrently, one request per image
     
+    Args:
+        sources (list): List of image URLs or file paths
+        prompt (str): Question or instruction about each image
+        detail (str): "low", "high", or "auto"
+        concurrency (int): Maximum number of requests in flight at once
+        system_prompt (str): Stable instructions sent as the system message
+    
+    Returns:
+        list: One response dict per source, in the same order as sources
+    """
+    sem = asyncio.Semaphore(concurrency)
+    
+    async def analyze_one(source):
+        async with sem:
+            return await analyze_image_async(source, prompt, detail, system_prompt)
+    
+    return await asyncio.gather(*(analyze_one(source) for source in sources))
+
+
+def analyze_image_from_url(image_url, prompt="What's in this image?", detail="auto",
+                           system_prompt=DEFAULT_SYSTEM_PROMPT):
+    """Synchronous wrapper around analyze_image_from_url_async"""
+    return _run(analyze_image_from_url_async(image_url, prompt, detail,
+                                             system_prompt))
+
+
+def analyze_image_from_file(image_path, prompt="What's in this image?", detail="auto",
+                            system_prompt=DEFAULT_SYSTEM_PROMPT):
+    """Synchronous wrapper around analyze_image_from_file_async"""
+    return _run(analyze_image_from_file_async(image_path, prompt, detail,
+                                              system_prompt))
+
+
+def analyze_image(source, prompt="What's in this image?", detail="auto",
+                  system_prompt=DEFAULT_SYSTEM_PROMPT):
+    """Synchronous wrapper around analyze_image_async"""
+    return _run(analyze_image_async(source, prompt, detail, system_prompt))
+
+
+def analyze_multiple_images(image_sources, prompt="Compare these images",
+                            system_prompt=DEFAULT_SYSTEM_PROMPT):
+    """Synchronous wrapper around analyze_multiple_images_async"""
+    return _run(analyze_multiple_images_async(image_sources, prompt,
+                                              system_prompt))
+
+
+def analyze_batch(sources, prompt="What's in this image?", detail="auto",
+                  concurrency=DEFAULT_CONCURRENCY, system_prompt=DEFAULT_SYSTEM_PROMPT):
+    """Synchronous wrapper around analyze_batch_async"""
+    return _run(analyze_batch_async(sources, prompt, detail, concurrency,
+                                    system_prompt))
+
+
+def analyze_image_stream(source, prompt="What's in this image?", detail="auto",
+                         system_prompt=DEFAULT_SYSTEM_PROMPT, result=None):
+    """
+    Synchronous generator wrapper around analyze_image_stream_async
+    
+    The stream runs on the shared background loop, so it reuses the same
+    client as the other sync wrappers. Closing the generator early closes
+    the underlying HTTP stream as well.
+    """
+    stream = analyze_image_stream_async(source, prompt, detail, system_prompt, result)
+    try:
+        while (text := _run(_next_or_none(stream))) is not None:
+            yield text
+    finally:
+        _run(stream.aclose())
+
+
+async def example_url_analysis():
+    """
+    Example 1: Analyze image from URL
+    """
     # Using a sample image URL (replace with your own)
     image_url = "https://upload.wikimedia.org/wikipedia/commons/thumb/d/dd/Gfp-wisconsin-madison-the-nature-boardwalk.jpg/2560px-Gfp-wisconsin-madison-the-nature-boardwalk.jpg"
     
-    result = analyze_image_from_url(
+    result = await analyze_image_from_url_async(
         image_url=image_url,
         prompt="Describe this image in detail. What are the key elements?",
         detail="auto"
     )
     
+    # Print the whole block at once so concurrent examples don't interleave
+    print("\nEXAMPLE 1: Analyzing image from URL")
+    print("-" * 60)
+    
     if result['success']:
         print("\nANALYSIS RESULT:")
         print("-" * 60)
@@ -340,27 +1244,49 @@ def main():
         print(f"  - Completion tokens: {result['completion_tokens']}")
     
     print("\n" + "=" * 60)
+
+
+async def example_security_analysis():
+    """
+    Example 2: Security-focused analysis of a local image
+    """
+    result = await analyze_image_from_file_async(
+        image_path="security_image.jpeg",
+        prompt="Analyze this security camera image. Describe any people, vehicles, or suspicious activity visible.",
+        detail="high"
+    )
     
-    # Example 2: Security-focused analysis
     print("\nEXAMPLE 2: Security-focused image analysis")
     print("-" * 60)
-    print("(Uncomment and provide a local image path to test)\n")
-    
-    # Uncomment to use with a local image:
-     result = analyze_image_from_file(
-         image_path="security_image.jpeg",
-         prompt="Analyze this security camera image. Describe any people, vehicles, or suspicious activity visible.",
-         detail="high"
-     )
-     
-     if result['success']:
-         print("\nSECURITY ANALYSIS:")
-         print("-" * 60)
-         print(result['analysis'])
     
+    if result['success']:
+        print("\nSECURITY ANALYSIS:")
+        print("-" * 60)
+        print(result['analysis'])
+    
+    print("\n" + "=" * 60)
+
+
+async def main():
+    """
+    Main demonstration function with cybersecurity-relevant examples
+    
+    Both examples run concurrently, so the demo takes as long as the
+    slower request rather than the sum of both.
+    """
     print("=" * 60)
+    print("OpenAI Vision API Demo")
+    print("=" * 60 + "\n")
+    
+    await asyncio.gather(
+        example_url_analysis(),
+        example_security_analysis()
+    )
+    
     print("Demo Complete!")
     print("=" * 60)
 
 if __name__ == "__main__":
-    main()
+    # Set LOG_LEVEL=DEBUG to print the raw JSON API responses
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "WARNING").upper())
+    asyncio.run(main())
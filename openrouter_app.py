@@ -8,6 +8,43 @@ import base64
 from openai import OpenAI
 from pathlib import Path
 
+# MIME type by file extension; anything else is sent as PNG
+MIME_TYPES = {
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.png': 'image/png'
+}
+
+# Configuration
+TARGET_FILE = "security_image.jpeg"
+SECURITY_PROMPT = f"""
+    Act as a professional Security Operations Center (SOC) Analyst. 
+    Analyze the provided image ({TARGET_FILE}) and provide a structured security report.
+
+    1. TIMESTAMPS & SOURCE:
+       - Identify the Camera ID (e.g., CAM 2).
+       - Record the exact date and time shown in the overlay.
+
+    2. SUBJECT IDENTIFICATION:
+       - Identify all people in the frame. 
+       - For the individual in uniform: Identify the agency name visible on their clothing (e.g., 'POLICE'). Note if they are armed or carrying equipment (handcuffs, radio, notebook).
+       - For the civilians: Describe their attire, physical build, and demeanor.
+
+    3. BEHAVIORAL ANALYSIS:
+       - Describe the interaction. Is it a confrontational, cooperative, or investigative scene?
+       - Note specific gestures. (e.g., "The male in the brown jacket is pointing toward the camera/house.")
+       - Is anyone taking notes or using a mobile device?
+
+    4. ANOMALY DETECTION:
+       - Identify any objects that are out of place.
+       - Are there vehicles visible in the background? If so, provide color and type.
+       - Identify any potential security vulnerabilities visible (e.g., open windows, unsecure perimeter).
+
+    5. RISK ASSESSMENT:
+       - Categorize this event: [Routine/Authorized], [Suspicious], or [Emergency].
+       - Provide a 1-sentence summary of what is happening for a security log.
+"""
+
 def get_client():
     """Initialize the OpenAI client configured for OpenRouter"""
     api_key = os.getenv("OPENROUTER_API_KEY")
@@ -44,8 +81,7 @@ def analyze_local_security_image(image_filename, prompt):
         base64_image = encode_image_to_base64(image_path)
         
         # Determine MIME type based on extension
-        ext = image_path.suffix.lower()
-        mime_type = "image/jpeg" if ext in ['.jpg', '.jpeg'] else "image/png"
+        mime_type = MIME_TYPES.get(image_path.suffix.lower(), "image/png")
 
         response = client.chat.completions.create(
             model="google/gemini-pro-1.5-vision",  # You can also use "openai/gpt-4o"
@@ -76,36 +112,6 @@ def analyze_local_security_image(image_filename, prompt):
         print(f"✗ An error occurred during analysis: {e}")
 
 def main():
-    # Configuration
-    TARGET_FILE = "security_image.jpeg"
-    SECURITY_PROMPT = f"""
-    Act as a professional Security Operations Center (SOC) Analyst. 
-    Analyze the provided image ({TARGET_FILE}) and provide a structured security report.
-
-    1. TIMESTAMPS & SOURCE:
-       - Identify the Camera ID (e.g., CAM 2).
-       - Record the exact date and time shown in the overlay.
-
-    2. SUBJECT IDENTIFICATION:
-       - Identify all people in the frame. 
-       - For the individual in uniform: Identify the agency name visible on their clothing (e.g., 'POLICE'). Note if they are armed or carrying equipment (handcuffs, radio, notebook).
-       - For the civilians: Describe their attire, physical build, and demeanor.
-
-    3. BEHAVIORAL ANALYSIS:
-       - Describe the interaction. Is it a confrontational, cooperative, or investigative scene?
-       - Note specific gestures. (e.g., "The male in the brown jacket is pointing toward the camera/house.")
-       - Is anyone taking notes or using a mobile device?
-
-    4. ANOMALY DETECTION:
-       - Identify any objects that are out of place.
-       - Are there vehicles visible in the background? If so, provide color and type.
-       - Identify any potential security vulnerabilities visible (e.g., open windows, unsecure perimeter).
-
-    5. RISK ASSESSMENT:
-       - Categorize this event: [Routine/Authorized], [Suspicious], or [Emergency].
-       - Provide a 1-sentence summary of what is happening for a security log.
-"""
-
     analyze_local_security_image(TARGET_FILE, SECURITY_PROMPT)
 
 if __name__ == "__main__":